@@ -2,7 +2,7 @@ import asyncio
 import json
 import os
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv
 from urllib.parse import urlparse, parse_qs
 
@@ -28,11 +28,19 @@ class AzureStandardLogicAppTool:
     and then invoking them with an appropriate payload.
     """
 
-    def __init__(self, subscription_id: str, resource_group: str, credential=None):
+    def __init__(
+        self,
+        subscription_id: str,
+        resource_group: str,
+        credential=None,
+        session: Optional[requests.Session] = None,
+    ):
         if credential is None:
             credential = DefaultAzureCredential()
         self.subscription_id = subscription_id
         self.resource_group = resource_group
+        # e.g. a recording/replaying session from recording.Cassette.requests_session()
+        self.session = session or requests.Session()
 
         self.callback_urls: Dict[str, str] = {}
 
@@ -53,7 +61,7 @@ class AzureStandardLogicAppTool:
         """
         url = f"{self.base_url}/providers/Microsoft.Web/sites/{logic_app_name}/hostruntime/runtime/webhooks/workflow/api/management/workflows?api-version=2018-11-01"
         headers = {"Authorization": f"Bearer {self.get_access_token()}"}
-        resp = requests.get(url, headers=headers)
+        resp = self.session.get(url, headers=headers)
         resp.raise_for_status()
         return resp.json()
 
@@ -65,7 +73,7 @@ class AzureStandardLogicAppTool:
         """
         url = f"{self.base_url}/providers/Microsoft.Web/sites/{logic_app_name}/hostruntime/runtime/webhooks/workflow/api/management/workflows/{workflow_name}/triggers/{trigger_name}/schemas/json?api-version=2024-11-01"
         headers = {"Authorization": f"Bearer {self.get_access_token()}"}
-        resp = requests.get(url, headers=headers)
+        resp = self.session.get(url, headers=headers)
         resp.raise_for_status()
         return resp.json()
 
@@ -184,7 +192,7 @@ class AzureStandardLogicAppTool:
         """
         url = f"{self.base_url}/providers/Microsoft.Web/sites/{logic_app_name}/hostruntime/runtime/webhooks/workflow/api/management/workflows/{workflow_name}/triggers/{trigger_name}/listCallbackUrl?api-version=2024-11-01"
         headers = {"Authorization": f"Bearer {self.get_access_token()}"}
-        resp = requests.post(url, headers=headers)
+        resp = self.session.post(url, headers=headers)
         resp.raise_for_status()
         return resp.json().get("value", "")
 
@@ -202,10 +210,12 @@ class FoundryTool:
         foundry_name: str,
         project_name: str,
         credential=None,
+        session: Optional[requests.Session] = None,
     ):
         if credential is None:
             credential = DefaultAzureCredential()
         self.credential = credential
+        self.session = session or requests.Session()
         self.subscription_id = subscription_id
         self.resource_group = resource_group
         self.foundry_name = foundry_name
@@ -234,7 +244,7 @@ class FoundryTool:
                 "metadata": {},
             }
         }
-        resp = requests.put(url, headers=headers, json=data)
+        resp = self.session.put(url, headers=headers, json=data)
         resp.raise_for_status()
         return resp.json()["id"]
 
@@ -298,8 +308,19 @@ if __name__ == "__main__":
     resource_group = os.environ.get("LOGIC_APP_RESOURCE_GROUP")
     logic_app_name = os.environ.get("LOGIC_APP_NAME")
 
+    # Optionally record/replay the ARM traffic of the discovery loop (see recording.py)
+    session, arm_credential, cassette = None, None, None
+    if os.environ.get("LOGIC_APP_CASSETTE"):
+        from recording import Cassette, ReplayCredential
+
+        cassette = Cassette(os.environ.get("LOGIC_APP_CASSETTE"))
+        session = cassette.requests_session()
+        arm_credential = None if cassette.recording else ReplayCredential()
+
     # Create the tool
-    logic_app_tool = AzureStandardLogicAppTool(subscription_id, resource_group)
+    logic_app_tool = AzureStandardLogicAppTool(
+        subscription_id, resource_group, credential=arm_credential, session=session
+    )
 
     # 1. List workflows
     workflows = logic_app_tool.list_standard_logic_app_workflows(logic_app_name)
@@ -372,6 +393,8 @@ if __name__ == "__main__":
             resource_group=os.environ.get("AZURE_AI_FOUNDRY_RESOURCE_GROUP"),
             foundry_name=os.environ.get("AZURE_AI_FOUNDRY_NAME"),
             project_name=os.environ.get("AZURE_AI_FOUNDRY_PROJECT_NAME"),
+            credential=arm_credential,
+            session=session,
         )
         connection_id = foundry_tool.create_custom_connection(
             connection_name=connection_name, sig=sig
@@ -393,6 +416,13 @@ if __name__ == "__main__":
         )
         openapi_tools.append(openapi_tool)
 
+    if cassette:
+        cassette.save()
+        # a replay only covers the ARM discovery, never update the live agent from it
+        if not cassette.recording:
+            print(f"Replayed {len(openapi_tools)} tools, skipping agent creation.")
+            exit(0)
+
     endpoint = os.environ.get("AZURE_AI_FOUNDRY_CONNECTION_STRING")
     deployment_name = os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME")
     api_version = os.environ.get("AZURE_OPENAI_API_VERSION", None)
@@ -0,0 +1,40 @@
+# Helpers for Azure AI Agents runs shared by the scripts in this folder
+# runs.create_and_process only takes a toolset, while tool_router.py and batch_eval.py
+# pass tools / tool_resources per run, so they create the run and poll it here.
+
+import asyncio
+
+# statuses in which the run is still working on its own
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "cancelling")
+
+
+class RunFailed(Exception):
+    """
+    Raised when an agent run ends in a state other than completed.
+    """
+
+    def __init__(self, status: str, last_error=None):
+        self.status = status
+        self.code = last_error.code if last_error else None
+        super().__init__(f"Run {status}: {last_error}")
+
+
+async def create_and_poll_run(
+    agents_client, thread_id: str, agent_id: str, polling_interval: float = 1, **kwargs
+):
+    """
+    Create a run (kwargs go to runs.create) and poll it until it finishes. Nothing here
+    submits tool outputs or approvals, so a run that requires action is cancelled rather
+    than left waiting until the service expires it. Raises RunFailed unless it completes.
+    """
+    run = await agents_client.runs.create(
+        thread_id=thread_id, agent_id=agent_id, **kwargs
+    )
+    while run.status in ACTIVE_RUN_STATUSES:
+        await asyncio.sleep(polling_interval)
+        run = await agents_client.runs.get(thread_id=thread_id, run_id=run.id)
+    if run.status == "requires_action":
+        await agents_client.runs.cancel(thread_id=thread_id, run_id=run.id)
+    if run.status != "completed":
+        raise RunFailed(run.status, run.last_error)
+    return run
@@ -0,0 +1,544 @@
+# Batch evaluation runner for agent prompts
+# Runs a JSONL dataset of questions against one or more agent definitions concurrently,
+# checks every answer against the expected properties and prints latency, token and
+# pass/fail tables. Responses are cached by (backend, definition hash, question), so
+# after editing one definition only its cases are run again.
+
+# Dataset line:
+#   {"id": "seattle", "question": "...", "expect": {"contains": ["Seattle"],
+#    "contains_any": ["☀️", "🌧️"], "not_contains": ["I don't know"], "regex": "\\|.*\\|",
+#    "max_latency_ms": 30000, "max_total_tokens": 4000}}
+# Definitions file: JSON list of {"name", "instructions", "model"?, "temperature"?, "tools"?}
+# where tools is a list of "weather" (OpenAPI, OPENAPI_SERVER_URL) and/or "mcp" (MCP_SERVER_URL).
+
+# Offline, against recorded responses:
+#   uv run batch_eval.py --backend mock
+# Live, against Azure AI Foundry (same .env as agent.py):
+#   uv run batch_eval.py --backend foundry --concurrency 4 --rps 1
+# Record the live session once, then replay it offline (see recording.py):
+#   uv run batch_eval.py --backend foundry --cassette cassettes/eval.jsonl.gz --no-cache
+#   uv run batch_eval.py --backend foundry --cassette cassettes/eval.jsonl.gz --no-cache --speed 0
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from agent_runs import create_and_poll_run
+
+
+def definition_hash(definition: Dict[str, Any]) -> str:
+    """
+    Stable hash of an agent definition; any change to instructions, model or tools changes it.
+    """
+    canonical = json.dumps(definition, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def load_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@dataclass
+class AgentReply:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+@dataclass
+class EvalResult:
+    definition: str
+    definition_hash: str
+    case_id: str
+    question: str
+    answer: str
+    latency_ms: float
+    prompt_tokens: int
+    completion_tokens: int
+    passed: bool
+    failures: List[str]
+    cached: bool = False
+
+
+class RateLimiter:
+    """
+    Spaces out request starts to at most `rate` per second (no limit when rate is None).
+    """
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class EvalCache:
+    """
+    Append-only JSONL cache of results keyed by backend, definition hash and question.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            for entry in load_jsonl(path):
+                self.entries[entry["key"]] = entry["result"]
+
+    @staticmethod
+    def key(backend: str, def_hash: str, question: str) -> str:
+        return hashlib.sha256(f"{backend}\n{def_hash}\n{question}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        self.entries[key] = result
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "result": result}) + "\n")
+
+
+def check_expectations(
+    expect: Dict[str, Any], reply: AgentReply, latency_ms: float
+) -> List[str]:
+    """
+    Return the list of failed expectations (empty when the answer passes).
+    """
+    failures = []
+    text = reply.text.lower()
+    for needle in expect.get("contains", []):
+        if needle.lower() not in text:
+            failures.append(f"missing '{needle}'")
+    if expect.get("contains_any") and not any(
+        needle.lower() in text for needle in expect["contains_any"]
+    ):
+        failures.append(f"none of {expect['contains_any']}")
+    for needle in expect.get("not_contains", []):
+        if needle.lower() in text:
+            failures.append(f"unexpected '{needle}'")
+    if expect.get("regex") and not re.search(expect["regex"], reply.text):
+        failures.append(f"no match for /{expect['regex']}/")
+    if expect.get("max_latency_ms") and latency_ms > expect["max_latency_ms"]:
+        failures.append(f"latency {latency_ms:.0f} ms > {expect['max_latency_ms']} ms")
+    total_tokens = reply.prompt_tokens + reply.completion_tokens
+    if expect.get("max_total_tokens") and total_tokens > expect["max_total_tokens"]:
+        failures.append(f"tokens {total_tokens} > {expect['max_total_tokens']}")
+    return failures
+
+
+class MockBackend:
+    """
+    Answers from recorded responses ({"definition", "case_id", "text", "latency_ms",
+    "prompt_tokens", "completion_tokens"} per line), waiting for the recorded latency
+    divided by `speed` (1 is the recorded speed, 0 answers immediately).
+    """
+
+    name = "mock"
+
+    def __init__(self, recordings_path: str, speed: float = 1.0):
+        self.speed = speed
+        # latencies scale with the speed, so results of other speeds are not reused
+        self.name = "mock" if speed == 1 else f"mock@{speed:g}x"
+        self.recordings: Dict[tuple, Dict[str, Any]] = {}
+        for recording in load_jsonl(recordings_path):
+            self.recordings[(recording["definition"], recording["case_id"])] = recording
+
+    def effective_definition(self, definition: Dict[str, Any]) -> Dict[str, Any]:
+        return definition
+
+    async def ask(self, definition: Dict[str, Any], case: Dict[str, Any]) -> AgentReply:
+        recording = self.recordings.get(
+            (definition["name"], case["id"])
+        ) or self.recordings.get(("*", case["id"]))
+        if recording is None:
+            raise KeyError(
+                f"No recording for definition {definition['name']!r} case {case['id']!r}"
+            )
+        if self.speed:
+            await asyncio.sleep(recording.get("latency_ms", 0) / 1000 / self.speed)
+        return AgentReply(
+            text=recording["text"],
+            prompt_tokens=recording.get("prompt_tokens", 0),
+            completion_tokens=recording.get("completion_tokens", 0),
+        )
+
+    async def close(self) -> None:
+        pass
+
+
+class FoundryBackend:
+    """
+    Runs every case on a new thread of an Azure AI Foundry agent. One agent is created per
+    definition hash and deleted again on close. `client_kwargs` are passed to the client,
+    e.g. the transport of a recording.Cassette.
+    """
+
+    name = "foundry"
+
+    def __init__(
+        self,
+        credential=None,
+        client_kwargs: Optional[Dict[str, Any]] = None,
+        polling_interval: int = 1,
+    ):
+        from azure.identity.aio import (
+            AzureDeveloperCliCredential,
+            DefaultAzureCredential,
+        )
+        from semantic_kernel.agents import AzureAIAgent, AzureAIAgentSettings
+
+        self.settings = AzureAIAgentSettings(
+            endpoint=os.environ.get("AZURE_AI_FOUNDRY_CONNECTION_STRING"),
+            model_deployment_name=os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
+            api_version=os.environ.get("AZURE_OPENAI_API_VERSION", None),
+        )
+        self.polling_interval = polling_interval
+        self.creds = credential or (
+            AzureDeveloperCliCredential(
+                tenant_id=os.environ.get("AZURE_TENANT_ID", None)
+            )
+            if os.environ.get("USE_AZURE_DEV_CLI") == "true"
+            else DefaultAzureCredential()
+        )
+        self.client = AzureAIAgent.create_client(
+            credential=self.creds,
+            endpoint=self.settings.endpoint,
+            api_version=self.settings.api_version,
+            **(client_kwargs or {}),
+        )
+        self.agents: Dict[str, Any] = {}
+        self._agent_locks: Dict[str, asyncio.Lock] = {}
+
+    def _tools(self, names: List[str]):
+        import jsonref
+        from azure.ai.agents.models import (
+            McpTool,
+            OpenApiAnonymousAuthDetails,
+            OpenApiTool,
+        )
+
+        unknown = set(names) - {"weather", "mcp"}
+        if unknown:
+            raise ValueError(f"Unknown tools: {sorted(unknown)}")
+        # a tool that cannot be built fails the case, it is never silently left out
+        for name, variable in (
+            ("weather", "OPENAPI_SERVER_URL"),
+            ("mcp", "MCP_SERVER_URL"),
+        ):
+            if name in names and not os.environ.get(variable):
+                raise ValueError(f"Tool '{name}' needs {variable} to be set")
+
+        definitions, resources = [], None
+        if "weather" in names:
+            with open("weather.json", "r") as f:
+                openapi_weather = jsonref.loads(f.read())
+                openapi_weather["servers"] = [
+                    {"url": os.environ.get("OPENAPI_SERVER_URL")}
+                ]
+            definitions += OpenApiTool(
+                name="WeatherAPI",
+                spec=openapi_weather,
+                auth=OpenApiAnonymousAuthDetails(),
+                description="Retrieve weather information for a location",
+            ).definitions
+        if "mcp" in names:
+            mcp_tool = McpTool(
+                server_label=os.environ.get("MCP_SERVER_LABEL", "tool"),
+                server_url=os.environ.get("MCP_SERVER_URL"),
+            )
+            mcp_tool.set_approval_mode("never")
+            definitions += mcp_tool.definitions
+            resources = mcp_tool.resources
+        return definitions, resources
+
+    def effective_definition(self, definition: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The definition as it is deployed: the default model filled in and the settings
+        of its tools (server URLs, MCP label, hash of the weather spec) added.
+        """
+        names = definition.get("tools", [])
+        tool_settings: Dict[str, Any] = {}
+        if "weather" in names:
+            with open("weather.json", "rb") as f:
+                spec_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+            tool_settings["weather"] = {
+                "server_url": os.environ.get("OPENAPI_SERVER_URL"),
+                "spec": spec_hash,
+            }
+        if "mcp" in names:
+            tool_settings["mcp"] = {
+                "server_url": os.environ.get("MCP_SERVER_URL"),
+                "server_label": os.environ.get("MCP_SERVER_LABEL", "tool"),
+            }
+        return {
+            **definition,
+            "model": definition.get("model") or self.settings.model_deployment_name,
+            "tool_settings": tool_settings,
+        }
+
+    async def _agent(self, definition: Dict[str, Any]):
+        definition = self.effective_definition(definition)
+        def_hash = definition_hash(definition)
+        lock = self._agent_locks.setdefault(def_hash, asyncio.Lock())
+        async with lock:
+            if def_hash not in self.agents:
+                tools, resources = self._tools(definition.get("tools", []))
+                agent = await self.client.agents.create_agent(
+                    model=definition["model"],
+                    name=f"{definition['name']}-eval-{def_hash[:8]}",
+                    instructions=definition["instructions"],
+                    tools=tools,
+                    temperature=definition.get("temperature", 0.2),
+                )
+                print(f"Created agent with id {agent.id} name: {agent.name}")
+                self.agents[def_hash] = (agent, resources)
+        return self.agents[def_hash]
+
+    async def ask(self, definition: Dict[str, Any], case: Dict[str, Any]) -> AgentReply:
+        from datetime import date
+
+        from azure.ai.agents.models import MessageRole, ThreadMessageOptions
+
+        agent, resources = await self._agent(definition)
+        # the thread is created with its message and the definition hash, so the request
+        # is unique per definition and question and a replayed cassette hands every case
+        # its own recorded thread, even when definitions share questions
+        thread = await self.client.agents.threads.create(
+            messages=[ThreadMessageOptions(role="user", content=case["question"])],
+            metadata={
+                "definition": definition_hash(self.effective_definition(definition))
+            },
+        )
+        try:
+            run = await create_and_poll_run(
+                self.client.agents,
+                thread_id=thread.id,
+                agent_id=agent.id,
+                polling_interval=self.polling_interval,
+                additional_instructions="Today is " + date.today().strftime("%Y-%m-%d"),
+                tool_resources=resources,
+            )
+            message = await self.client.agents.messages.get_last_message_text_by_role(
+                thread_id=thread.id, role=MessageRole.AGENT
+            )
+            return AgentReply(
+                text=message.text.value if message else "",
+                prompt_tokens=run.usage.prompt_tokens if run.usage else 0,
+                completion_tokens=run.usage.completion_tokens if run.usage else 0,
+            )
+        finally:
+            await self.client.agents.threads.delete(thread.id)
+
+    async def close(self) -> None:
+        for agent, _ in self.agents.values():
+            await self.client.agents.delete_agent(agent.id)
+        await self.client.close()
+        await self.creds.close()
+
+
+def create_backend(
+    kind: str,
+    recordings: Optional[str] = None,
+    speed: float = 1.0,
+    cassette_path: Optional[str] = None,
+):
+    """
+    Create the "mock" or "foundry" backend; the foundry backend records to / replays from
+    the cassette when one is given. Returns the backend and the cassette (or None).
+    """
+    if kind == "mock":
+        return MockBackend(recordings, speed=speed), None
+
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
+    if not cassette_path:
+        return FoundryBackend(), None
+
+    from recording import AsyncReplayCredential, Cassette
+
+    cassette = Cassette(cassette_path, speed=speed)
+    replaying = not cassette.recording
+    backend = FoundryBackend(
+        credential=AsyncReplayCredential() if replaying else None,
+        client_kwargs={"transport": cassette.azure_transport()},
+        # recorded polls are served in order, no need to wait between them
+        polling_interval=0 if replaying and not speed else 1,
+    )
+    if replaying:
+        # replayed latencies scale with the speed, like the mock backend
+        backend.name = "foundry-replay" if speed == 1 else f"foundry-replay@{speed:g}x"
+    return backend, cassette
+
+
+async def run_evaluation(
+    backend,
+    definitions: List[Dict[str, Any]],
+    cases: List[Dict[str, Any]],
+    cache: EvalCache,
+    concurrency: int = 4,
+    rate: Optional[float] = None,
+) -> List[EvalResult]:
+    """
+    Run every case against every definition, skipping cached (unchanged) pairs.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate)
+
+    async def evaluate(definition: Dict[str, Any], case: Dict[str, Any]) -> EvalResult:
+        # hashed as the backend deploys it, so a new default model is not a cache hit
+        def_hash = definition_hash(backend.effective_definition(definition))
+        key = EvalCache.key(backend.name, def_hash, case["question"])
+        cached = cache.get(key)
+        if cached:
+            reply = AgentReply(
+                cached["answer"], cached["prompt_tokens"], cached["completion_tokens"]
+            )
+            latency_ms = cached["latency_ms"]
+        error = None
+        if not cached:
+            async with semaphore:
+                await limiter.wait()
+                start = time.perf_counter()
+                try:
+                    reply = await backend.ask(definition, case)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    reply = AgentReply(text=f"Error: {e}")
+                latency_ms = (time.perf_counter() - start) * 1000
+
+        # an error fails the case whatever the expectations, they could match its text
+        failures = (
+            [error]
+            if error
+            else check_expectations(case.get("expect", {}), reply, latency_ms)
+        )
+        result = EvalResult(
+            definition=definition["name"],
+            definition_hash=def_hash,
+            case_id=case["id"],
+            question=case["question"],
+            answer=reply.text,
+            latency_ms=latency_ms,
+            prompt_tokens=reply.prompt_tokens,
+            completion_tokens=reply.completion_tokens,
+            passed=not failures,
+            failures=failures,
+            cached=cached is not None,
+        )
+        # errors are not cached so they are retried on the next run
+        if not cached and not error:
+            cache.put(key, asdict(result))
+        return result
+
+    return await asyncio.gather(
+        *(evaluate(definition, case) for definition in definitions for case in cases)
+    )
+
+
+def print_report(results: List[EvalResult]) -> None:
+    print(
+        "\n| Definition | Case | Result | Latency ms | Prompt tok | Completion tok | Cached | Failures |"
+    )
+    print("|---|---|---|---:|---:|---:|---|---|")
+    for r in results:
+        print(
+            f"| {r.definition} | {r.case_id} | {'PASS' if r.passed else 'FAIL'} "
+            f"| {r.latency_ms:.0f} | {r.prompt_tokens} | {r.completion_tokens} "
+            f"| {'yes' if r.cached else 'no'} | {'; '.join(r.failures)} |"
+        )
+
+    def percentile(values: List[float], p: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    print(
+        "\n| Definition | Hash | Passed | p50 ms | p95 ms | Prompt tok | Completion tok | Cached |"
+    )
+    print("|---|---|---:|---:|---:|---:|---:|---:|")
+    for name in dict.fromkeys(r.definition for r in results):
+        rows = [r for r in results if r.definition == name]
+        latencies = [r.latency_ms for r in rows]
+        print(
+            f"| {name} | {rows[0].definition_hash} "
+            f"| {sum(r.passed for r in rows)}/{len(rows)} "
+            f"| {percentile(latencies, 0.5):.0f} | {percentile(latencies, 0.95):.0f} "
+            f"| {sum(r.prompt_tokens for r in rows)} "
+            f"| {sum(r.completion_tokens for r in rows)} "
+            f"| {sum(r.cached for r in rows)} |"
+        )
+
+
+async def main(args: argparse.Namespace) -> None:
+    with open(args.definitions, "r", encoding="utf-8") as f:
+        definitions = json.load(f)
+    if args.only:
+        definitions = [d for d in definitions if d["name"] in args.only]
+    cases = load_jsonl(args.dataset)
+
+    backend, cassette = create_backend(
+        args.backend, args.recordings, args.speed, args.cassette
+    )
+    cache = EvalCache(None if args.no_cache else args.cache)
+    start = time.perf_counter()
+    try:
+        results = await run_evaluation(
+            backend, definitions, cases, cache, args.concurrency, args.rps
+        )
+    finally:
+        await backend.close()
+        if cassette:
+            cassette.save()
+    elapsed = time.perf_counter() - start
+
+    print_report(results)
+    print(
+        f"\n{len(results)} cases, {sum(not r.cached for r in results)} executed, "
+        f"{sum(r.passed for r in results)} passed in {elapsed:.1f} s"
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(asdict(r), ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch evaluation of agent prompts")
+    parser.add_argument("--dataset", default="eval/questions.jsonl")
+    parser.add_argument("--definitions", default="eval/definitions.json")
+    parser.add_argument("--only", nargs="*", help="definition names to run")
+    parser.add_argument("--backend", choices=["mock", "foundry"], default="mock")
+    parser.add_argument("--recordings", default="eval/recorded.jsonl")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="replay speed of mock/cassette, 1 is recorded speed, 0 as fast as possible",
+    )
+    parser.add_argument(
+        "--cassette",
+        help="foundry backend: record to this cassette, or replay it when it exists",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rps", type=float, default=None, help="max runs per second")
+    parser.add_argument("--cache", default="eval/.cache/results.jsonl")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", help="write all results as JSONL")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,415 @@
+# Conversation compaction to bound thread growth and per-turn latency
+# Every turn on a long-lived thread/conversation resends the whole history, so prompt
+# tokens and latency climb turn after turn. The ConversationManager keeps an incremental
+# token count per thread and, once a budget is exceeded, folds the older turns into a
+# compact memory (summarized or truncated) and keeps only the most recent turns.
+#
+# How the compacted state is applied:
+#   * Agents (v1, AzureAIAgent / runs.create): the thread stays, each run gets
+#     `truncation_strategy` (last N messages) and the memory as `additional_instructions`,
+#     see `run_options()`.
+#   * Conversations (v2, openai conversations/responses): a fresh conversation is seeded
+#     with the memory plus the kept turns, see `conversation_items()`.
+#
+# Per-turn stats (tokens with/without compaction, time spent compacting, latency and
+# usage reported by the service) are kept in `manager.stats` and can be printed.
+#
+# Offline simulation of a long conversation:
+#   uv run conversation.py --turns 40 --budget 3000
+# Live, against the weather/MCP agent from mcp.py (same .env):
+#   uv run conversation.py --live --turns 6 --budget 1500
+
+import argparse
+import asyncio
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# async callable turning (previous memory, turns to fold in) into the new memory
+Summarizer = Callable[[str, List["Turn"]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English), good enough for budgets.
+    """
+    return max(1, (len(text) + 3) // 4)
+
+
+@dataclass
+class Turn:
+    role: str
+    text: str
+    tokens: int
+
+
+@dataclass
+class TurnStats:
+    turn: int
+    history_tokens: int  # what the turn would have sent without compaction
+    sent_tokens: int  # memory + kept turns actually sent
+    compacted: bool = False
+    compaction_ms: float = 0.0
+    latency_ms: Optional[float] = None
+    prompt_tokens: Optional[int] = None  # as reported by the service
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.history_tokens - self.sent_tokens
+
+
+@dataclass
+class ThreadState:
+    turns: List[Turn] = field(default_factory=list)
+    memory: str = ""
+    memory_tokens: int = 0
+    # running totals, updated incrementally as turns are added or folded in
+    active_tokens: int = 0
+    history_tokens: int = 0
+    compactions: int = 0
+
+
+def truncating_summarizer(
+    max_chars_per_turn: int = 160, max_chars: int = 2000
+) -> Summarizer:
+    """
+    Summarizer that needs no model: keeps the first sentence of every folded turn, and
+    drops the oldest lines once the memory exceeds `max_chars`.
+    """
+
+    async def summarize(memory: str, turns: List[Turn]) -> str:
+        lines = memory.splitlines() if memory else []
+        for turn in turns:
+            first = re.split(r"(?<=[.!?])\s", turn.text.strip(), maxsplit=1)[0]
+            lines.append(f"- {turn.role}: {first[:max_chars_per_turn]}")
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > max_chars:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    return summarize
+
+
+def openai_summarizer(openai_client, model: str, max_tokens: int = 300) -> Summarizer:
+    """
+    Summarizer using a chat model, e.g. the client from `client.get_openai_client()`.
+    """
+
+    async def summarize(memory: str, turns: List[Turn]) -> str:
+        transcript = "\n".join(f"{turn.role}: {turn.text}" for turn in turns)
+        response = await openai_client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Update the conversation memory with the new transcript. "
+                    "Keep facts, names, locations, decisions and open questions. "
+                    "Answer with the updated memory only, as short bullet points.",
+                },
+                {
+                    "role": "user",
+                    "content": f"Memory:\n{memory or '(empty)'}\n\nTranscript:\n{transcript}",
+                },
+            ],
+        )
+        return response.choices[0].message.content or memory
+
+    return summarize
+
+
+class ConversationManager:
+    """
+    Tracks the token size of each thread and compacts it once `budget` tokens are reached,
+    keeping the last `keep_last` turns verbatim. `on_compaction(thread_id, stats)` is
+    awaited after every compaction.
+    """
+
+    def __init__(
+        self,
+        budget: int = 4000,
+        keep_last: int = 4,
+        summarizer: Optional[Summarizer] = None,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        on_compaction: Optional[Callable[[str, TurnStats], Awaitable[None]]] = None,
+    ):
+        # the newest user message is always kept, a run has to see the question it answers
+        if keep_last < 1:
+            raise ValueError(f"keep_last must be at least 1, got {keep_last}")
+        self.budget = budget
+        self.keep_last = keep_last
+        self.summarizer = summarizer or truncating_summarizer()
+        self.count_tokens = count_tokens
+        self.on_compaction = on_compaction
+        self.threads: Dict[str, ThreadState] = {}
+        self.stats: Dict[str, List[TurnStats]] = {}
+
+    def _state(self, thread_id: str) -> ThreadState:
+        return self.threads.setdefault(thread_id, ThreadState())
+
+    def add_turn(self, thread_id: str, role: str, text: str) -> Turn:
+        """
+        Record a message of the thread (user question or agent answer).
+        """
+        state = self._state(thread_id)
+        turn = Turn(role, text, self.count_tokens(text))
+        state.turns.append(turn)
+        state.active_tokens += turn.tokens
+        state.history_tokens += turn.tokens
+        return turn
+
+    async def prepare_turn(self, thread_id: str, user_message: str) -> TurnStats:
+        """
+        Record the user message and compact the thread if it is over budget. Call before
+        sending the message, then apply `run_options()` or `conversation_items()`.
+        """
+        state = self._state(thread_id)
+        self.add_turn(thread_id, "user", user_message)
+        stats = TurnStats(
+            turn=len(self.stats.setdefault(thread_id, [])) + 1,
+            history_tokens=state.history_tokens,
+            sent_tokens=0,
+        )
+        if state.memory_tokens + state.active_tokens > self.budget:
+            start = time.perf_counter()
+            stats.compacted = await self._compact(state)
+            stats.compaction_ms = (time.perf_counter() - start) * 1000
+        stats.sent_tokens = state.memory_tokens + state.active_tokens
+        self.stats[thread_id].append(stats)
+        if stats.compacted and self.on_compaction:
+            await self.on_compaction(thread_id, stats)
+        return stats
+
+    def record_response(
+        self,
+        thread_id: str,
+        text: str,
+        latency_ms: Optional[float] = None,
+        prompt_tokens: Optional[int] = None,
+    ) -> None:
+        """
+        Record the agent answer together with the measured latency and reported usage.
+        """
+        self.add_turn(thread_id, "assistant", text)
+        if self.stats.get(thread_id):
+            self.stats[thread_id][-1].latency_ms = latency_ms
+            self.stats[thread_id][-1].prompt_tokens = prompt_tokens
+
+    async def _compact(self, state: ThreadState) -> bool:
+        """
+        Fold all but the last `keep_last` turns into the memory. Returns False, leaving
+        the thread unchanged, when there is nothing to fold or the new memory would not
+        be smaller than the memory and turns it replaces.
+        """
+        if len(state.turns) <= self.keep_last:
+            return False
+        folded = state.turns[: -self.keep_last]
+        folded_tokens = sum(turn.tokens for turn in folded)
+        memory = await self.summarizer(state.memory, folded)
+        memory_tokens = self.count_tokens(memory)
+        if memory_tokens >= state.memory_tokens + folded_tokens:
+            return False
+        state.turns = state.turns[-self.keep_last :]
+        state.active_tokens -= folded_tokens
+        state.memory = memory
+        state.memory_tokens = memory_tokens
+        state.compactions += 1
+        return True
+
+    def memory_instructions(self, thread_id: str) -> Optional[str]:
+        state = self._state(thread_id)
+        if not state.memory:
+            return None
+        return f"Summary of the earlier conversation:\n{state.memory}"
+
+    def run_options(
+        self, thread_id: str, additional_instructions: Optional[str] = None
+    ) -> Dict[str, object]:
+        """
+        Keyword arguments for AzureAIAgent.invoke / runs.create on a v1 thread: the service
+        only reads the kept turns, the memory travels as additional instructions.
+        """
+        from azure.ai.agents.models import TruncationObject
+
+        state = self._state(thread_id)
+        options: Dict[str, object] = {}
+        instructions = [
+            text
+            for text in (additional_instructions, self.memory_instructions(thread_id))
+            if text
+        ]
+        if instructions:
+            options["additional_instructions"] = "\n\n".join(instructions)
+        if state.compactions:
+            options["truncation_strategy"] = TruncationObject(
+                type="last_messages", last_messages=len(state.turns)
+            )
+        return options
+
+    def conversation_items(self, thread_id: str) -> List[Dict[str, str]]:
+        """
+        Items to seed a new v2 conversation with after a compaction (memory + kept turns).
+        """
+        state = self._state(thread_id)
+        items = []
+        memory = self.memory_instructions(thread_id)
+        if memory:
+            items.append({"type": "message", "role": "developer", "content": memory})
+        for turn in state.turns:
+            items.append({"type": "message", "role": turn.role, "content": turn.text})
+        return items
+
+    def print_stats(self, thread_id: str) -> None:
+        rows = self.stats.get(thread_id, [])
+        print(
+            "| Turn | History tok | Sent tok | Saved tok | Compacted | Compaction ms | Latency ms | Prompt tok |"
+        )
+        print("|---:|---:|---:|---:|---|---:|---:|---:|")
+        for s in rows:
+            latency = f"{s.latency_ms:.0f}" if s.latency_ms is not None else ""
+            print(
+                f"| {s.turn} | {s.history_tokens} | {s.sent_tokens} | {s.saved_tokens} "
+                f"| {'yes' if s.compacted else ''} | {s.compaction_ms:.2f} | {latency} "
+                f"| {s.prompt_tokens if s.prompt_tokens is not None else ''} |"
+            )
+        history = sum(s.history_tokens for s in rows)
+        sent = sum(s.sent_tokens for s in rows)
+        if history:
+            print(
+                f"Total: {sent} of {history} history tokens sent "
+                f"({1 - sent / history:.1%} saved), "
+                f"{self._state(thread_id).compactions} compactions"
+            )
+        reported = [s for s in rows if s.prompt_tokens is not None]
+        if reported:
+            print(
+                f"Reported: {sum(s.prompt_tokens for s in reported)} prompt tokens over "
+                f"{len(reported)} runs (estimated sent "
+                f"{sum(s.sent_tokens for s in reported)})"
+            )
+
+
+CITIES = ["Seattle", "Galway", "Cary", "Warsaw", "Oslo", "Lisbon", "Denver", "Tokyo"]
+
+
+async def run_simulation(turns: int, budget: int, keep_last: int) -> None:
+    async def on_compaction(thread_id: str, stats: TurnStats) -> None:
+        print(
+            f"Compacted {thread_id} at turn {stats.turn} in {stats.compaction_ms:.2f} ms, "
+            f"{stats.saved_tokens} tokens saved"
+        )
+
+    manager = ConversationManager(
+        budget=budget, keep_last=keep_last, on_compaction=on_compaction
+    )
+    for turn in range(turns):
+        city = CITIES[turn % len(CITIES)]
+        await manager.prepare_turn("thread_sim", f"What is the weather in {city}?")
+        manager.record_response(
+            "thread_sim",
+            f"Top of the morning from {city}! ☔ Here is your forecast. "
+            + "| Day | Temp | Humidity | Precipitation | Wind |\n" * 6
+            + "Don't forget your umbrella, the clouds are feeling dramatic today.",
+        )
+    manager.print_stats("thread_sim")
+
+
+async def run_live(turns: int, budget: int, keep_last: int) -> None:
+    # imported here so the simulation runs without credentials or a .env
+    from datetime import date
+
+    from azure.ai.agents.models import McpTool
+    from azure.identity.aio import AzureDeveloperCliCredential, DefaultAzureCredential
+    from dotenv import load_dotenv
+    from semantic_kernel.agents import (
+        AzureAIAgent,
+        AzureAIAgentSettings,
+        AzureAIAgentThread,
+    )
+
+    load_dotenv(override=True)
+
+    ai_agent_settings = AzureAIAgentSettings(
+        endpoint=os.environ.get("AZURE_AI_FOUNDRY_CONNECTION_STRING"),
+        model_deployment_name=os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
+        api_version=os.environ.get("AZURE_OPENAI_API_VERSION", None),
+    )
+    creds = (
+        AzureDeveloperCliCredential(tenant_id=os.environ.get("AZURE_TENANT_ID", None))
+        if os.environ.get("USE_AZURE_DEV_CLI") == "true"
+        else DefaultAzureCredential()
+    )
+    client = AzureAIAgent.create_client(
+        credential=creds,
+        endpoint=ai_agent_settings.endpoint,
+        api_version=ai_agent_settings.api_version,
+    )
+
+    mcp_tool = McpTool(
+        server_label=os.environ.get("MCP_SERVER_LABEL", "tool"),
+        server_url=os.environ.get("MCP_SERVER_URL"),
+    )
+    mcp_tool.set_approval_mode("never")
+    agent_definition = await client.agents.create_agent(
+        model=ai_agent_settings.model_deployment_name,
+        name="Compacted-MCP-Agent",
+        instructions="you are a helpful assistant",
+        tools=mcp_tool.definitions,
+        temperature=0.2,
+    )
+    agent = AzureAIAgent(client=client, definition=agent_definition)
+
+    manager = ConversationManager(budget=budget, keep_last=keep_last)
+    thread = AzureAIAgentThread(client=client)
+    await thread.create()
+    for turn in range(turns):
+        user_message = f"What's the weather in {CITIES[turn % len(CITIES)]}?"
+        await manager.prepare_turn(thread.id, user_message)
+        start = time.perf_counter()
+        answers, run_id = [], None
+        async for agent_response in agent.invoke(
+            messages=user_message,
+            thread=thread,
+            tools=mcp_tool.resources,
+            **manager.run_options(
+                thread.id,
+                additional_instructions="Today is " + date.today().strftime("%Y-%m-%d"),
+            ),
+        ):
+            print(f"MCP Agent: {agent_response}")
+            answers.append(str(agent_response))
+            run_id = (agent_response.metadata or {}).get("run_id", run_id)
+        latency_ms = (time.perf_counter() - start) * 1000
+        # the usage reported for the whole run, to compare with the estimated sent tokens
+        prompt_tokens = None
+        if run_id:
+            run = await client.agents.runs.get(thread_id=thread.id, run_id=run_id)
+            prompt_tokens = run.usage.prompt_tokens if run.usage else None
+        manager.record_response(
+            thread.id,
+            "\n".join(answers),
+            latency_ms=latency_ms,
+            prompt_tokens=prompt_tokens,
+        )
+
+    manager.print_stats(thread.id)
+    await thread.delete()
+    await client.agents.delete_agent(agent.id)
+    await client.close()
+    await creds.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conversation compaction")
+    parser.add_argument("--live", action="store_true", help="run against Foundry")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--budget", type=int, default=3000)
+    parser.add_argument("--keep-last", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.live:
+        asyncio.run(run_live(args.turns, args.budget, args.keep_last))
+    else:
+        asyncio.run(run_simulation(args.turns, args.budget, args.keep_last))
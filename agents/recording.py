@@ -0,0 +1,687 @@
+# Record/replay of HTTP traffic for offline benchmarks and regression tests
+# A Cassette captures real sessions (status, selected headers, body chunks and their
+# timing, so SSE streams keep their shape) into a compact JSONL file, optionally
+# gzipped, and replays them either at recorded speed or as fast as possible.
+#
+# It plugs into the three HTTP stacks used in this repo:
+#   * azure-core (AzureAIAgent.create_client / AIProjectClient / AgentsClient):
+#       AzureAIAgent.create_client(credential=..., endpoint=..., transport=cassette.azure_transport())
+#   * openai (AsyncOpenAI / AsyncAzureOpenAI, e.g. from client.get_openai_client()):
+#       openai_client = openai_client.with_options(http_client=cassette.httpx_client())
+#   * requests (AzureStandardLogicAppTool / FoundryTool ARM calls):
+#       AzureStandardLogicAppTool(subscription_id, resource_group, session=cassette.requests_session())
+#
+# Replays need no network and no login, use AsyncReplayCredential/ReplayCredential instead
+# of DefaultAzureCredential. Request headers are never stored, request bodies only as a
+# hash, and SAS signatures / keys in URLs and response bodies are redacted.
+#
+# Summarize a cassette:
+#   uv run recording.py cassettes/weather.jsonl.gz
+
+import argparse
+import asyncio
+import base64
+import codecs
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+import requests
+from azure.core.credentials import AccessToken
+from azure.core.exceptions import HttpResponseError, ResponseNotReadError
+from azure.core.pipeline.transport import AioHttpTransport, AsyncHttpTransport
+from azure.core.rest import AsyncHttpResponse
+from azure.core.utils import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# response headers worth keeping, everything else (cookies, tracing ids, ...) is dropped
+KEPT_RESPONSE_HEADERS = {
+    "content-type",
+    "location",
+    "operation-location",
+    "azure-asyncoperation",
+    "retry-after",
+}
+# query parameters that are secrets or vary per call, ignored when matching and never stored
+IGNORED_QUERY_PARAMS = {"sig", "sv", "sp", "se", "code", "api-key"}
+REDACTIONS = [
+    (re.compile(r"([?&]sig=)[^&\"\s]+"), r"\1REDACTED"),
+    (
+        re.compile(
+            r"(\"(?:sig|key|api_key|access_token|primaryKey|secondaryKey)\"\s*:\s*\")[^\"]+"
+        ),
+        r"\1REDACTED",
+    ),
+]
+
+
+class CassetteMiss(Exception):
+    """
+    Raised when replaying a request that was not recorded.
+    """
+
+
+def _normalize_url(url: str) -> str:
+    parts = urlsplit(str(url))
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in IGNORED_QUERY_PARAMS
+    )
+    return urlunsplit(
+        (parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), "")
+    )
+
+
+def _body_hash(body: Any) -> Optional[str]:
+    if not body:
+        return None
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if not isinstance(body, (bytes, bytearray)):
+        return None  # streamed/file bodies are matched on method and URL only
+    return hashlib.sha256(body).hexdigest()[:16]
+
+
+def _redact(text: str) -> str:
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _redact_chunks(texts: List[str]) -> List[str]:
+    """
+    Redact a body that arrived in pieces. The joined text is redacted, so secrets split
+    across chunks are caught, and the chunk boundaries are moved to match; a boundary that
+    falls inside a secret moves behind its replacement.
+    """
+    text = "".join(texts)
+    bounds, end = [], 0
+    for piece in texts:
+        end += len(piece)
+        bounds.append(end)
+    for pattern, replacement in REDACTIONS:
+        edits = []
+
+        def substitute(match: re.Match) -> str:
+            redacted = match.expand(replacement)
+            edits.append((match.start(), match.end(), len(redacted)))
+            return redacted
+
+        text = pattern.sub(substitute, text)
+        shifted = []
+        for bound in bounds:
+            delta = 0
+            for start, stop, length in edits:
+                if stop <= bound:
+                    delta += length - (stop - start)
+                elif start < bound:
+                    bound = start + length
+                    break
+                else:
+                    break
+            shifted.append(bound + delta)
+        bounds = shifted
+    return [text[a:b] for a, b in zip([0] + bounds[:-1], bounds)]
+
+
+class Cassette:
+    """
+    Ordered list of recorded HTTP interactions.
+
+    mode: "record" (call the service and capture), "replay" (serve from the file) or
+    "auto" (replay when the file exists, record otherwise).
+    speed: replay speed factor, 1.0 is the recorded speed, 0 replays as fast as possible.
+    merge_ms: consecutive body chunks received within this interval are stored as one.
+    strict: replay only requests whose body matches the recording exactly, instead of
+    falling back to method and URL.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = "auto",
+        speed: float = 1.0,
+        merge_ms: float = 5.0,
+        strict: bool = False,
+    ):
+        if mode == "auto":
+            mode = "replay" if os.path.exists(path) else "record"
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.merge_ms = merge_ms
+        self.strict = strict
+        self.interactions: List[Dict[str, Any]] = []
+        self._unused: List[int] = []
+        if mode == "replay":
+            self.interactions = self.load(path)
+            self._unused = list(range(len(self.interactions)))
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @staticmethod
+    def load(path: str) -> List[Dict[str, Any]]:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def save(self) -> None:
+        if not self.recording:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        opener = gzip.open if self.path.endswith(".gz") else open
+        # interactions still streaming (or failed before a response) are skipped
+        finished = [i for i in self.interactions if "chunks" in i]
+        with opener(self.path, "wt", encoding="utf-8") as f:
+            for interaction in finished:
+                f.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+        print(f"Saved {len(finished)} interactions to {self.path}")
+
+    def __enter__(self) -> "Cassette":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.save()
+
+    # -- recording -------------------------------------------------------------
+
+    def _start(self, method: str, url: str, body: Any) -> Dict[str, Any]:
+        # the slot is reserved when the request starts, so the order of the cassette is the
+        # order in which requests were sent even if their responses finish out of order
+        interaction = {
+            "method": method.upper(),
+            "url": _normalize_url(url),
+            "body_hash": _body_hash(body),
+            "status": None,
+            "_start": time.perf_counter(),
+            "_chunks": [],
+        }
+        self.interactions.append(interaction)
+        return interaction
+
+    def _headers(
+        self, interaction: Dict[str, Any], status: int, reason: str, headers
+    ) -> None:
+        interaction["status"] = status
+        interaction["reason"] = reason
+        interaction["headers"] = {
+            k.lower(): _redact(v)
+            for k, v in headers.items()
+            if k.lower() in KEPT_RESPONSE_HEADERS
+        }
+        interaction["latency_ms"] = round(
+            (time.perf_counter() - interaction["_start"]) * 1000, 1
+        )
+
+    def _chunk(self, interaction: Dict[str, Any], chunk: bytes) -> None:
+        if not chunk:
+            return
+        offset = round((time.perf_counter() - interaction["_start"]) * 1000, 1)
+        chunks = interaction["_chunks"]
+        if chunks and offset - chunks[-1][0] < self.merge_ms:
+            chunks[-1][1] += chunk
+        else:
+            chunks.append([offset, bytearray(chunk)])
+
+    def _finish(self, interaction: Dict[str, Any]) -> None:
+        chunks = interaction.pop("_chunks", None)
+        interaction.pop("_start", None)
+        if chunks is None:
+            return  # already finished
+        # decoded incrementally, a character split across two chunks is not binary data
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            texts = [decoder.decode(bytes(data)) for _, data in chunks]
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            interaction["encoding"] = "base64"
+            interaction["chunks"] = [
+                [offset, base64.b64encode(bytes(data)).decode("ascii")]
+                for offset, data in chunks
+            ]
+            return
+        interaction["chunks"] = [
+            [offset, text]
+            for (offset, _), text in zip(chunks, _redact_chunks(texts))
+            if text
+        ]
+
+    # -- replay ----------------------------------------------------------------
+
+    def _find(self, method: str, url: str, body: Any) -> Dict[str, Any]:
+        """
+        Take the first unused interaction matching method, URL and body; fall back to
+        method and URL only (bodies often carry dates or generated ids) unless strict.
+        A fallback that has to pick between several recorded requests is logged, it may
+        hand this request another request's response.
+        """
+        method, url, body_hash = method.upper(), _normalize_url(url), _body_hash(body)
+        candidates = []
+        for position, index in enumerate(self._unused):
+            candidate = self.interactions[index]
+            if candidate["method"] != method or candidate["url"] != url:
+                continue
+            if candidate.get("body_hash") == body_hash:
+                del self._unused[position]
+                return candidate
+            candidates.append(position)
+        if not candidates:
+            raise CassetteMiss(f"No recorded interaction for {method} {url}")
+        if self.strict:
+            raise CassetteMiss(
+                f"No recorded interaction for {method} {url} with body {body_hash}"
+            )
+        if len(candidates) > 1:
+            logger.warning(
+                "Body %s of %s %s was not recorded, replaying the first of %d "
+                "interactions with other bodies",
+                body_hash,
+                method,
+                url,
+                len(candidates),
+            )
+        return self.interactions[self._unused.pop(candidates[0])]
+
+    def _chunks(self, interaction: Dict[str, Any]) -> List[tuple]:
+        decode = (
+            base64.b64decode
+            if interaction.get("encoding") == "base64"
+            else lambda text: text.encode("utf-8")
+        )
+        return [(offset, decode(data)) for offset, data in interaction["chunks"]]
+
+    def _delay(self, offset_ms: float, start: float) -> float:
+        if not self.speed:
+            return 0.0
+        return offset_ms / 1000 / self.speed - (time.perf_counter() - start)
+
+    async def _play(
+        self, interaction: Dict[str, Any], start: float
+    ) -> AsyncIterator[bytes]:
+        for offset, data in self._chunks(interaction):
+            delay = self._delay(offset, start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield data
+
+    def _play_sync(self, interaction: Dict[str, Any], start: float) -> Iterator[bytes]:
+        for offset, data in self._chunks(interaction):
+            delay = self._delay(offset, start)
+            if delay > 0:
+                time.sleep(delay)
+            yield data
+
+    # -- integrations ----------------------------------------------------------
+
+    def azure_transport(
+        self, inner: Optional[AsyncHttpTransport] = None
+    ) -> "CassetteAsyncTransport":
+        return CassetteAsyncTransport(self, inner)
+
+    def httpx_client(self, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=CassetteHttpxTransport(self), **kwargs)
+
+    def requests_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = CassetteRequestsAdapter(self)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+
+class _CassetteAzureResponse(AsyncHttpResponse):
+    """
+    azure-core response served from a chunk iterator (a replayed or a recording stream).
+    """
+
+    def __init__(
+        self,
+        request,
+        status_code: int,
+        reason: str,
+        headers: Dict[str, str],
+        chunks: AsyncIterator[bytes],
+    ):
+        self._request = request
+        self._status_code = status_code
+        self._reason = reason
+        self._headers = CaseInsensitiveDict(headers)
+        self._chunks = chunks
+        self._content: Optional[bytes] = None
+        self._encoding: Optional[str] = None
+        self._is_closed = False
+        self._is_stream_consumed = False
+
+    @property
+    def request(self):
+        return self._request
+
+    @property
+    def status_code(self) -> int:
+        return self._status_code
+
+    @property
+    def headers(self):
+        return self._headers
+
+    @property
+    def reason(self) -> str:
+        return self._reason
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self._headers.get("content-type")
+
+    @property
+    def is_closed(self) -> bool:
+        return self._is_closed
+
+    @property
+    def is_stream_consumed(self) -> bool:
+        return self._is_stream_consumed
+
+    @property
+    def encoding(self) -> Optional[str]:
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, value: Optional[str]) -> None:
+        self._encoding = value
+
+    @property
+    def url(self) -> str:
+        return self._request.url
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            raise ResponseNotReadError(self)
+        return self._content
+
+    def text(self, encoding: Optional[str] = None) -> str:
+        return self.content.decode(encoding or self._encoding or "utf-8")
+
+    def json(self) -> Any:
+        return json.loads(self.text()) if self.content else None
+
+    def raise_for_status(self) -> None:
+        if self._status_code >= 400:
+            raise HttpResponseError(response=self)
+
+    async def read(self) -> bytes:
+        if self._content is None:
+            self._content = b"".join([chunk async for chunk in self.iter_bytes()])
+        return self._content
+
+    async def iter_raw(self, **kwargs) -> AsyncIterator[bytes]:
+        async for chunk in self.iter_bytes(**kwargs):
+            yield chunk
+
+    async def iter_bytes(self, **kwargs) -> AsyncIterator[bytes]:
+        if self._content is not None:
+            yield self._content
+            return
+        self._is_stream_consumed = True
+        async for chunk in self._chunks:
+            yield chunk
+        await self.close()
+
+    async def close(self) -> None:
+        if not self._is_closed:
+            self._is_closed = True
+            await self._chunks.aclose()
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+
+class CassetteAsyncTransport(AsyncHttpTransport):
+    """
+    azure-core async transport recording through `inner` (AioHttpTransport by default)
+    or replaying from the cassette.
+    """
+
+    def __init__(self, cassette: Cassette, inner: Optional[AsyncHttpTransport] = None):
+        self.cassette = cassette
+        self.inner = inner or (AioHttpTransport() if cassette.recording else None)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        if self.inner:
+            await self.inner.open()
+
+    async def close(self) -> None:
+        if self.inner:
+            await self.inner.close()
+
+    async def send(self, request, *, stream: bool = False, **kwargs):
+        if self.cassette.recording:
+            interaction = self.cassette._start(
+                request.method, request.url, request.content
+            )
+            response = await self.inner.send(request, stream=True, **kwargs)
+            self.cassette._headers(
+                interaction, response.status_code, response.reason, response.headers
+            )
+
+            async def chunks() -> AsyncIterator[bytes]:
+                try:
+                    async for chunk in response.iter_bytes():
+                        self.cassette._chunk(interaction, chunk)
+                        yield chunk
+                finally:
+                    self.cassette._finish(interaction)
+                    await response.close()
+
+            headers = dict(response.headers)
+            headers.pop("Content-Encoding", None)
+            headers.pop("content-encoding", None)
+        else:
+            start = time.perf_counter()
+            interaction = self.cassette._find(
+                request.method, request.url, request.content
+            )
+            delay = self.cassette._delay(interaction["latency_ms"], start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            chunks = lambda: self.cassette._play(interaction, start)
+            headers = interaction["headers"]
+
+        replayed = _CassetteAzureResponse(
+            request, interaction["status"], interaction["reason"], headers, chunks()
+        )
+        if not stream:
+            await replayed.read()
+        return replayed
+
+
+class _CassetteHttpxStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._chunks:
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self._chunks.aclose()
+
+
+class CassetteHttpxTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport (used by the openai client) recording or replaying through the cassette.
+    """
+
+    def __init__(
+        self, cassette: Cassette, inner: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.cassette = cassette
+        self.inner = inner or (
+            httpx.AsyncHTTPTransport() if cassette.recording else None
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if self.cassette.recording:
+            # plain bodies keep cassettes readable, the file itself can be gzipped
+            request.headers["Accept-Encoding"] = "identity"
+            interaction = self.cassette._start(request.method, str(request.url), body)
+            response = await self.inner.handle_async_request(request)
+            self.cassette._headers(
+                interaction,
+                response.status_code,
+                response.extensions.get("reason_phrase", b"").decode("ascii", "ignore"),
+                response.headers,
+            )
+
+            async def chunks() -> AsyncIterator[bytes]:
+                try:
+                    async for chunk in response.aiter_raw():
+                        self.cassette._chunk(interaction, chunk)
+                        yield chunk
+                finally:
+                    self.cassette._finish(interaction)
+                    await response.aclose()
+
+            headers = response.headers
+        else:
+            start = time.perf_counter()
+            interaction = self.cassette._find(request.method, str(request.url), body)
+            delay = self.cassette._delay(interaction["latency_ms"], start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            chunks = lambda: self.cassette._play(interaction, start)
+            headers = interaction["headers"]
+
+        return httpx.Response(
+            status_code=interaction["status"],
+            headers=headers,
+            stream=_CassetteHttpxStream(chunks()),
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        if self.inner:
+            await self.inner.aclose()
+
+
+class CassetteRequestsAdapter(requests.adapters.HTTPAdapter):
+    """
+    requests adapter recording or replaying through the cassette (bodies are always read).
+    """
+
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, stream=False, **kwargs) -> requests.Response:
+        if self.cassette.recording:
+            interaction = self.cassette._start(
+                request.method, request.url, request.body
+            )
+            response = super().send(request, stream=True, **kwargs)
+            self.cassette._headers(
+                interaction, response.status_code, response.reason, response.headers
+            )
+            content = []
+            try:
+                for chunk in response.iter_content(chunk_size=None):
+                    self.cassette._chunk(interaction, chunk)
+                    content.append(chunk)
+            finally:
+                self.cassette._finish(interaction)
+            # the caller gets the unredacted body, only the cassette is redacted
+            response._content = b"".join(content)
+            return response
+
+        start = time.perf_counter()
+        interaction = self.cassette._find(request.method, request.url, request.body)
+        delay = self.cassette._delay(interaction["latency_ms"], start)
+        if delay > 0:
+            time.sleep(delay)
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.reason = interaction["reason"]
+        response.headers = requests.structures.CaseInsensitiveDict(
+            interaction["headers"]
+        )
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = b"".join(self.cassette._play_sync(interaction, start))
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+class ReplayCredential:
+    """
+    Sync credential handing out a static token, so replays need no login.
+    """
+
+    def get_token(self, *scopes, **kwargs) -> AccessToken:
+        return AccessToken("replay", int(time.time()) + 3600)
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncReplayCredential:
+    """
+    Async counterpart of ReplayCredential for the aio clients.
+    """
+
+    async def get_token(self, *scopes, **kwargs) -> AccessToken:
+        return AccessToken("replay", int(time.time()) + 3600)
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+
+def summarize(path: str) -> None:
+    interactions = Cassette.load(path)
+    print(f"{path}: {len(interactions)} interactions, {os.path.getsize(path)} bytes")
+    print("| # | Method | URL | Status | Latency ms | Chunks | Last chunk ms |")
+    print("|---:|---|---|---:|---:|---:|---:|")
+    total_ms = 0.0
+    for index, interaction in enumerate(interactions):
+        chunks = interaction.get("chunks", [])
+        last_ms = chunks[-1][0] if chunks else interaction["latency_ms"]
+        total_ms += last_ms
+        url = urlsplit(interaction["url"])
+        print(
+            f"| {index} | {interaction['method']} | {url.netloc}{url.path} "
+            f"| {interaction['status']} | {interaction['latency_ms']:.0f} "
+            f"| {len(chunks)} | {last_ms:.0f} |"
+        )
+    print(f"Recorded time (sequential): {total_ms / 1000:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a recorded cassette")
+    parser.add_argument("cassette")
+    summarize(parser.parse_args().cassette)
@@ -0,0 +1,445 @@
+# Embedding based tool router for Azure AI Agents
+# Agents that carry many tools (several MCP servers, one OpenAPI tool per Logic App
+# workflow, ...) send every tool definition on every run, which inflates prompt tokens
+# and latency. The router embeds tool descriptions once into an in-memory vector index
+# and, for each incoming message, selects only the top-k relevant tools. The selected
+# definitions/resources are then passed per run via `tools=` / `tool_resources=`.
+
+# Live usage (needs the same .env as agent.py plus AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME):
+#   uv run tool_router.py
+# Offline recall/latency benchmark with a deterministic local embedding stub:
+#   uv run tool_router.py --benchmark --tools 300 --top-k 3
+
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from azure.ai.agents.models import McpTool, OpenApiTool, ToolDefinition, ToolResources
+
+# async callable turning a batch of texts into a batch of vectors
+Embedder = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedding stub (feature hashing of word unigrams and bigrams).
+    Needs no service, so the router can be benchmarked and exercised offline.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[index] += sign
+        return vector
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_one(text) for text in texts]
+
+
+def openai_embedder(openai_client, model: str) -> Embedder:
+    """
+    Wrap an (async) OpenAI client, e.g. from `client.get_openai_client()`, as an embedder.
+    """
+
+    async def embed(texts: List[str]) -> List[List[float]]:
+        response = await openai_client.embeddings.create(model=model, input=texts)
+        return [item.embedding for item in response.data]
+
+    return embed
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        return vector
+    return [v / norm for v in vector]
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def merge_tool_resources(resources: List[ToolResources]) -> Optional[ToolResources]:
+    """
+    Merge the resources of several tools into one ToolResources (list entries, such as
+    `mcp`, are concatenated; anything else is taken from the last tool that sets it).
+    """
+    merged: Dict[str, Any] = {}
+    for resource in resources:
+        if not resource:
+            continue
+        for key, value in resource.as_dict().items():
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            else:
+                merged[key] = value
+    return ToolResources(merged) if merged else None
+
+
+@dataclass
+class ToolEntry:
+    name: str
+    description: str
+    definitions: List[ToolDefinition]
+    resources: Optional[ToolResources] = None
+    vector: List[float] = field(default_factory=list, repr=False)
+
+
+@dataclass
+class RoutedTools:
+    names: List[str]
+    scores: List[float]
+    definitions: List[ToolDefinition]
+    resources: Optional[ToolResources]
+    embed_ms: float
+    search_ms: float
+
+
+class ToolRouter:
+    """
+    Keeps an in-memory vector index of tool descriptions and selects the top-k tools
+    relevant to a message. Only tools scoring above `min_score` are selected, so tools
+    with no similarity at all are never sent. Tools in `always_include` are returned on
+    every selection.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        top_k: int = 3,
+        min_score: float = 0.0,
+        always_include: Optional[List[str]] = None,
+    ):
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self.always_include = set(always_include or [])
+        self.tools: Dict[str, ToolEntry] = {}
+        self._indexed = False
+
+    def add_tool(
+        self,
+        name: str,
+        description: str,
+        definitions: List[ToolDefinition],
+        resources: Optional[ToolResources] = None,
+    ) -> None:
+        """
+        Register a tool. New tools are embedded by the next `build()` or `select()`.
+        """
+        self.tools[name] = ToolEntry(name, description, definitions, resources)
+        self._indexed = False
+
+    def add_openapi_tool(
+        self, tool: OpenApiTool, description: Optional[str] = None
+    ) -> None:
+        """
+        Register an OpenApiTool. The description defaults to the tool description plus
+        the summary/description of every operation in the spec.
+        """
+        for definition in tool.definitions:
+            openapi = definition.openapi
+            if description is None:
+                parts = [openapi.name, openapi.description or ""]
+                for path in (openapi.spec or {}).get("paths", {}).values():
+                    for operation in path.values():
+                        if isinstance(operation, dict):
+                            parts.append(operation.get("operationId", ""))
+                            parts.append(operation.get("summary", ""))
+                            parts.append(operation.get("description", ""))
+                text = " ".join(part for part in parts if part)
+            else:
+                text = description
+            self.add_tool(openapi.name, text, [definition])
+
+    def add_mcp_tool(self, tool: McpTool, description: str) -> None:
+        """
+        Register an McpTool. MCP definitions carry no description, so one is required.
+        """
+        self.add_tool(
+            tool.server_label,
+            f"{tool.server_label} {description}",
+            tool.definitions,
+            tool.resources,
+        )
+
+    async def build(self, batch_size: int = 256) -> None:
+        """
+        Embed the descriptions of all tools not indexed yet, in batches.
+        """
+        missing = self.always_include - self.tools.keys()
+        if missing:
+            raise ValueError(f"always_include names unknown tools: {sorted(missing)}")
+        pending = [entry for entry in self.tools.values() if not entry.vector]
+        for offset in range(0, len(pending), batch_size):
+            batch = pending[offset : offset + batch_size]
+            vectors = await self.embedder([entry.description for entry in batch])
+            for entry, vector in zip(batch, vectors):
+                entry.vector = _normalize(vector)
+        self._indexed = True
+
+    async def select(self, message: str, top_k: Optional[int] = None) -> RoutedTools:
+        """
+        Select the tools most relevant to the message.
+        """
+        if not self._indexed:
+            await self.build()
+
+        start = time.perf_counter()
+        query = _normalize((await self.embedder([message]))[0])
+        embedded = time.perf_counter()
+
+        scored = sorted(
+            (
+                (_dot(query, entry.vector), entry)
+                for entry in self.tools.values()
+                if entry.name not in self.always_include
+            ),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        k = self.top_k if top_k is None else top_k
+        selected = [self.tools[name] for name in sorted(self.always_include)]
+        scores = [1.0] * len(selected)
+        for score, entry in scored[:k]:
+            if score <= self.min_score:
+                break
+            selected.append(entry)
+            scores.append(score)
+        searched = time.perf_counter()
+
+        definitions: List[ToolDefinition] = []
+        for entry in selected:
+            definitions = definitions + entry.definitions
+        return RoutedTools(
+            names=[entry.name for entry in selected],
+            scores=scores,
+            definitions=definitions,
+            resources=merge_tool_resources([entry.resources for entry in selected]),
+            embed_ms=(embedded - start) * 1000,
+            search_ms=(searched - embedded) * 1000,
+        )
+
+
+# Synthetic Logic App style workflows used by the offline benchmark
+BENCHMARK_ACTIONS = {
+    "create": "Create a new",
+    "get": "Retrieve the details of an existing",
+    "list": "List all",
+    "update": "Update the fields of an existing",
+    "cancel": "Cancel an existing",
+    "approve": "Approve a pending",
+}
+BENCHMARK_ENTITIES = [
+    "invoice", "purchase order", "shipment", "customer", "employee", "timesheet",
+    "expense report", "support ticket", "contract", "vendor", "warehouse stock",
+    "sales lead", "maintenance request", "elevator inspection", "weather alert",
+    "payroll run", "travel booking", "insurance claim", "subscription", "refund",
+    "meeting room", "laptop order", "security badge", "training course", "survey",
+    "purchase requisition", "sales quote", "delivery route", "fleet vehicle",
+    "spare part", "field technician", "service contract", "customer complaint",
+    "quality audit", "safety incident", "building permit", "energy report",
+    "parking permit", "visitor pass", "job posting", "job candidate",
+    "performance review", "leave request", "bank transfer", "tax filing",
+    "budget forecast", "marketing campaign", "press release", "product recall",
+    "software license",
+]  # fmt: skip
+BENCHMARK_QUESTIONS = {
+    "create": "Please create a {entity} for ACME",
+    "get": "Can you show me the details of {entity} 4711?",
+    "list": "List every {entity} we have",
+    "update": "Update the {entity} 4711 with the new values",
+    "cancel": "Cancel the {entity} 4711",
+    "approve": "Approve the pending {entity} 4711",
+}
+
+
+async def run_benchmark(tool_count: int, top_k: int, queries: int, seed: int) -> None:
+    rng = random.Random(seed)
+    combinations = [
+        (action, entity)
+        for entity in BENCHMARK_ENTITIES
+        for action in BENCHMARK_ACTIONS
+    ]
+    rng.shuffle(combinations)
+    combinations = combinations[:tool_count]
+
+    router = ToolRouter(HashingEmbedder(), top_k=top_k)
+    for action, entity in combinations:
+        name = f"{action}_{entity.replace(' ', '_')}"
+        description = f"{name.replace('_', ' ')}: {BENCHMARK_ACTIONS[action]} {entity}"
+        router.add_tool(name, description, [])
+
+    start = time.perf_counter()
+    await router.build()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    hits = 0
+    embed_ms: List[float] = []
+    search_ms: List[float] = []
+    for _ in range(queries):
+        action, entity = rng.choice(combinations)
+        expected = f"{action}_{entity.replace(' ', '_')}"
+        routed = await router.select(BENCHMARK_QUESTIONS[action].format(entity=entity))
+        hits += expected in routed.names
+        embed_ms.append(routed.embed_ms)
+        search_ms.append(routed.search_ms)
+
+    def percentile(values: List[float], p: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    print(f"Tools indexed:   {len(router.tools)} (build {build_ms:.1f} ms)")
+    print(f"Queries:         {queries}, top_k={top_k}")
+    print(f"Recall@{top_k}:       {hits / queries:.3f}")
+    print(
+        f"Embed latency:   p50 {percentile(embed_ms, 0.5):.3f} ms, p95 {percentile(embed_ms, 0.95):.3f} ms"
+    )
+    print(
+        f"Search latency:  p50 {percentile(search_ms, 0.5):.3f} ms, p95 {percentile(search_ms, 0.95):.3f} ms"
+    )
+    print(
+        f"Tools sent/run:  {top_k} instead of {len(router.tools)} ({top_k / len(router.tools):.1%})"
+    )
+
+
+async def run_live() -> None:
+    # imported here so the offline benchmark runs without credentials or a .env
+    import os
+    from datetime import date
+
+    import jsonref
+    from azure.ai.agents.models import OpenApiAnonymousAuthDetails
+    from agent_runs import RunFailed, create_and_poll_run
+    from azure.identity.aio import AzureDeveloperCliCredential, DefaultAzureCredential
+    from dotenv import load_dotenv
+    from semantic_kernel.agents import (
+        AzureAIAgent,
+        AzureAIAgentSettings,
+    )
+
+    load_dotenv(override=True)
+
+    ai_agent_settings = AzureAIAgentSettings(
+        endpoint=os.environ.get("AZURE_AI_FOUNDRY_CONNECTION_STRING"),
+        model_deployment_name=os.environ.get("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"),
+        api_version=os.environ.get("AZURE_OPENAI_API_VERSION", None),
+    )
+    embedding_deployment = os.environ.get(
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", "text-embedding-3-small"
+    )
+    creds = (
+        AzureDeveloperCliCredential(tenant_id=os.environ.get("AZURE_TENANT_ID", None))
+        if os.environ.get("USE_AZURE_DEV_CLI") == "true"
+        else DefaultAzureCredential()
+    )
+    client = AzureAIAgent.create_client(
+        credential=creds,
+        endpoint=ai_agent_settings.endpoint,
+        api_version=ai_agent_settings.api_version,
+    )
+    openai_client = await client.get_openai_client(api_version="2024-02-01")
+    router = ToolRouter(openai_embedder(openai_client, embedding_deployment), top_k=1)
+
+    mcp_server_url = os.environ.get("MCP_SERVER_URL", None)
+    if mcp_server_url:
+        mcp_tool = McpTool(
+            server_label=os.environ.get("MCP_SERVER_LABEL", "tool"),
+            server_url=mcp_server_url,
+        )
+        mcp_tool.set_approval_mode("never")
+        router.add_mcp_tool(
+            mcp_tool, f"documentation and source code of {mcp_server_url}"
+        )
+
+    openapi_server_url = os.environ.get("OPENAPI_SERVER_URL", None)
+    if openapi_server_url:
+        with open("weather.json", "r") as f:
+            openapi_weather = jsonref.loads(f.read())
+            openapi_weather["servers"] = [{"url": openapi_server_url}]
+        router.add_openapi_tool(
+            OpenApiTool(
+                name="WeatherAPI",
+                spec=openapi_weather,
+                auth=OpenApiAnonymousAuthDetails(),
+                description="Retrieve weather information for a location",
+            )
+        )
+
+    await router.build()
+
+    # the agent itself carries no tools, every run gets only the routed ones
+    agent_definition = await client.agents.create_agent(
+        model=ai_agent_settings.model_deployment_name,
+        name="Routed-Tools-Agent",
+        instructions="you are a helpful assistant",
+        temperature=0.2,
+    )
+    agent = AzureAIAgent(client=client, definition=agent_definition)
+
+    user_message = "What is the weather forecast for today and tomorrow in Seattle?"
+    routed = await router.select(user_message)
+    print(
+        f"Routed tools: {list(zip(routed.names, routed.scores))} "
+        f"(embed {routed.embed_ms:.1f} ms, search {routed.search_ms:.3f} ms)"
+    )
+
+    thread = await client.agents.threads.create()
+    await client.agents.messages.create(
+        thread_id=thread.id, role="user", content=user_message
+    )
+    try:
+        run = await create_and_poll_run(
+            client.agents,
+            thread_id=thread.id,
+            agent_id=agent.id,
+            additional_instructions="Today is " + date.today().strftime("%Y-%m-%d"),
+            tools=routed.definitions,
+            tool_resources=routed.resources,
+        )
+        print(f"Run finished with status: {run.status}")
+    except RunFailed as e:
+        print(e)
+    async for message in client.agents.messages.list(thread_id=thread.id):
+        print(
+            f"{message.role}: {message.text_messages[-1].text.value if message.text_messages else ''}"
+        )
+
+    await client.agents.delete_agent(agent.id)
+    await client.close()
+    await creds.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Route agent tools by embedding similarity"
+    )
+    parser.add_argument(
+        "--benchmark", action="store_true", help="run offline benchmark"
+    )
+    parser.add_argument("--tools", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if args.tools < 1 or args.queries < 1:
+        parser.error("--tools and --queries must be at least 1")
+
+    if args.benchmark:
+        asyncio.run(run_benchmark(args.tools, args.top_k, args.queries, args.seed))
+    else:
+        asyncio.run(run_live())
@@ -0,0 +1,456 @@
+# Queue-driven worker for high-throughput batch jobs against the agents
+# Pushes large numbers of questions through the agent definitions of batch_eval.py
+# (eval/definitions.json) with a pool of asyncio workers, optionally spread over several
+# processes, with per-agent rate limits, retries of transient failures, checkpointing for
+# resume and results written as they complete.
+#
+# Job sources:
+#   * JSONL file (--jobs): one {"id", "question", "agent"?} per line. Finished ids are read
+#     back from the results file(s) on start, so a rerun resumes where it stopped.
+#   * SQLite queue (--queue): table `jobs`, enqueue with --enqueue FILE. Job state lives in
+#     the database (pending/running/done/failed), results are stored next to the jobs.
+#     Running jobs hold a lease that their process keeps renewing, so several workers can
+#     share a queue. A stopped worker releases its jobs; the jobs of a process that died
+#     go back to pending once the lease expired, at the next launch or lease renewal of
+#     any worker on the queue.
+# Failed jobs are not run again unless --retry-failed is given.
+#
+# Offline, against the recorded mock answers:
+#   uv run worker.py --jobs eval/questions.jsonl --agent Jonny_Weather --backend mock
+# Overnight run, 4 processes x 16 workers, at most 5 runs/s for the weather agent:
+#   uv run worker.py --queue jobs.db --enqueue questions.jsonl
+#   uv run worker.py --queue jobs.db --backend foundry --processes 4 --workers 16 \
+#       --rate Jonny_Weather=5 --output results.jsonl
+
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from agent_runs import RunFailed
+from batch_eval import RateLimiter, create_backend, load_jsonl
+
+# HTTP statuses and run error codes worth retrying
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+TRANSIENT_RUN_ERRORS = {"rate_limit_exceeded", "server_error"}
+# SQLite leases: renewed this often while a job is held, expired when not renewed for LEASE
+LEASE_RENEW_SECONDS = 30
+LEASE_SECONDS = 120
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Whether a failed job should be retried (throttling, timeouts, 5xx, dropped connections).
+    """
+    if isinstance(error, RunFailed):
+        return error.code in TRANSIENT_RUN_ERRORS or error.status == "expired"
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    # azure-core network errors (ServiceRequestError/ServiceResponseError and subclasses)
+    return any(
+        cls.__name__ in ("ServiceRequestError", "ServiceResponseError")
+        for cls in type(error).__mro__
+    )
+
+
+def shard_of(job_id: str, shards: int) -> int:
+    return zlib.crc32(job_id.encode("utf-8")) % shards
+
+
+class FileQueue:
+    """
+    Jobs from a JSONL file, results appended to a JSONL file per shard. Job ids found in
+    earlier results are skipped, failed ones only when `retry_failed` is not set.
+    """
+
+    def __init__(
+        self,
+        jobs_path: str,
+        output: str,
+        shard: int = 0,
+        shards: int = 1,
+        retry_failed: bool = False,
+    ):
+        self.jobs_path = jobs_path
+        self.shard = shard
+        self.shards = shards
+        root, ext = os.path.splitext(output)
+        self.output = output if shards == 1 else f"{root}.shard{shard}{ext}"
+        self.finished: Set[str] = set()
+        # results of any earlier run count, whatever the shard count was then
+        for path in [output] + glob.glob(f"{root}.shard*{ext}"):
+            if os.path.exists(path):
+                for result in load_jsonl(path):
+                    if result["status"] == "done" or not retry_failed:
+                        self.finished.add(result["id"])
+        self._file = open(self.output, "a", encoding="utf-8")
+
+    async def jobs(self) -> AsyncIterator[Dict[str, Any]]:
+        with open(self.jobs_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                job = json.loads(line)
+                job["id"] = str(job["id"])
+                if shard_of(job["id"], self.shards) != self.shard:
+                    continue
+                if job["id"] not in self.finished:
+                    yield job
+
+    def finish(self, result: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SqliteQueue:
+    """
+    Jobs in a SQLite table. Workers claim pending jobs in small batches, so several
+    processes can share one queue; results are written back and optionally streamed to
+    a JSONL file as well. Claimed jobs stay leased to this process until they finish,
+    `renew()` has to be called every LEASE_RENEW_SECONDS.
+    """
+
+    def __init__(self, path: str, output: Optional[str] = None, batch_size: int = 20):
+        self.path = path
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                agent TEXT,
+                question TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._file = open(output, "a", encoding="utf-8") if output else None
+        self._held: Set[str] = set()
+
+    def enqueue(self, jobs_path: str) -> int:
+        before = self.db.total_changes
+        self.db.execute("BEGIN")
+        for job in load_jsonl(jobs_path):
+            self.db.execute(
+                "INSERT OR IGNORE INTO jobs (id, agent, question) VALUES (?, ?, ?)",
+                (str(job["id"]), job.get("agent"), job["question"]),
+            )
+        self.db.execute("COMMIT")
+        return self.db.total_changes - before
+
+    def requeue(self, retry_failed: bool = False) -> None:
+        """
+        Put running jobs whose lease expired (their process died) back to 'pending', and
+        failed jobs as well when `retry_failed` is set.
+        """
+        self.db.execute(
+            "UPDATE jobs SET status = 'pending' WHERE status = 'running' AND updated_at < ?",
+            (time.time() - LEASE_SECONDS,),
+        )
+        if retry_failed:
+            self.db.execute(
+                "UPDATE jobs SET status = 'pending' WHERE status = 'failed'"
+            )
+
+    def renew(self) -> None:
+        """
+        Extend the lease of every job this process holds.
+        """
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.executemany(
+            "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = 'running'",
+            [(now, job_id) for job_id in self._held],
+        )
+        self.db.execute("COMMIT")
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        self.db.execute("BEGIN IMMEDIATE")
+        rows = self.db.execute(
+            "SELECT id, agent, question FROM jobs WHERE status = 'pending' LIMIT ?",
+            (self.batch_size,),
+        ).fetchall()
+        self.db.executemany(
+            "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+            [(time.time(), row[0]) for row in rows],
+        )
+        self.db.execute("COMMIT")
+        self._held.update(row[0] for row in rows)
+        return [{"id": row[0], "agent": row[1], "question": row[2]} for row in rows]
+
+    async def jobs(self) -> AsyncIterator[Dict[str, Any]]:
+        while True:
+            batch = self._claim()
+            if not batch:
+                return
+            for job in batch:
+                yield job
+
+    def finish(self, result: Dict[str, Any]) -> None:
+        self.db.execute(
+            "UPDATE jobs SET status = ?, attempts = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (
+                result["status"],
+                result["attempts"],
+                json.dumps(result, ensure_ascii=False),
+                result.get("error"),
+                time.time(),
+                result["id"],
+            ),
+        )
+        self._held.discard(result["id"])
+        if self._file:
+            self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def counts(self) -> Dict[str, int]:
+        return dict(
+            self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        )
+
+    def close(self) -> None:
+        # jobs claimed but not finished (interrupted run) are released for the next run
+        if self._held:
+            self.db.executemany(
+                "UPDATE jobs SET status = 'pending' WHERE id = ? AND status = 'running'",
+                [(job_id,) for job_id in self._held],
+            )
+            self._held.clear()
+        self.db.close()
+        if self._file:
+            self._file.close()
+
+
+async def run_worker_pool(
+    queue,
+    backend,
+    definitions: Dict[str, Dict[str, Any]],
+    default_agent: Optional[str],
+    workers: int = 8,
+    rates: Optional[Dict[str, float]] = None,
+    max_attempts: int = 5,
+    timeout: float = 300,
+    shard: int = 0,
+) -> Dict[str, int]:
+    """
+    Feed jobs from the queue to `workers` concurrent tasks and record every result.
+    """
+    limiters = {name: RateLimiter(rate) for name, rate in (rates or {}).items()}
+    pending: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    counts = {"done": 0, "failed": 0, "retried": 0}
+    start = time.perf_counter()
+
+    async def process(job: Dict[str, Any]) -> Dict[str, Any]:
+        agent = job.get("agent") or default_agent
+        definition = definitions.get(agent)
+        if definition is None:
+            return {
+                "status": "failed",
+                "error": f"Unknown agent: {agent}",
+                "attempts": 0,
+            }
+        limiter = limiters.get(agent)
+        for attempt in range(1, max_attempts + 1):
+            if limiter:
+                await limiter.wait()
+            started = time.perf_counter()
+            try:
+                # asyncio.timeout, unlike wait_for on 3.11, never swallows a cancellation
+                async with asyncio.timeout(timeout):
+                    reply = await backend.ask(definition, job)
+                return {
+                    "status": "done",
+                    "answer": reply.text,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "prompt_tokens": reply.prompt_tokens,
+                    "completion_tokens": reply.completion_tokens,
+                    "attempts": attempt,
+                }
+            except Exception as e:
+                if attempt == max_attempts or not is_transient(e):
+                    return {"status": "failed", "error": repr(e), "attempts": attempt}
+                counts["retried"] += 1
+                # exponential backoff with jitter, capped at a minute
+                await asyncio.sleep(min(60, 2**attempt) * random.uniform(0.5, 1.5))
+
+    async def work() -> None:
+        while True:
+            job = await pending.get()
+            if job is None:
+                return
+            result = {
+                "id": job["id"],
+                "agent": job.get("agent") or default_agent,
+                "question": job["question"],
+                **await process(job),
+            }
+            queue.finish(result)
+            counts[result["status"]] += 1
+            finished = counts["done"] + counts["failed"]
+            if finished % 100 == 0:
+                rate = finished / (time.perf_counter() - start)
+                print(f"[shard {shard}] {finished} jobs finished ({rate:.1f}/s)")
+
+    async def feed() -> None:
+        async for job in queue.jobs():
+            await pending.put(job)
+        for _ in range(workers):
+            await pending.put(None)
+
+    async def renew_leases() -> None:
+        while True:
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
+            queue.renew()
+            queue.requeue()
+
+    tasks = [asyncio.create_task(feed())]
+    tasks += [asyncio.create_task(work()) for _ in range(workers)]
+    watched = set(tasks)
+    if hasattr(queue, "renew"):
+        watched.add(asyncio.create_task(renew_leases()))
+    try:
+        # a failing worker, feeder or lease renewal stops the run, otherwise the feeder
+        # would block forever on the full queue
+        while not all(task.done() for task in tasks):
+            done, watched = await asyncio.wait(
+                watched, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+    finally:
+        for task in tasks + list(watched):
+            task.cancel()
+    return counts
+
+
+async def run_shard(
+    args: argparse.Namespace, shard: int, shards: int
+) -> Dict[str, int]:
+    with open(args.definitions, "r", encoding="utf-8") as f:
+        definitions = {d["name"]: d for d in json.load(f)}
+    # per-agent limits are global, every process gets its share
+    rates = {}
+    for rate in args.rate or []:
+        name, value = rate.split("=", 1)
+        rates[name] = float(value) / shards
+
+    if args.queue:
+        output = None
+        if args.output:
+            root, ext = os.path.splitext(args.output)
+            output = args.output if shards == 1 else f"{root}.shard{shard}{ext}"
+        queue = SqliteQueue(args.queue, output)
+    else:
+        queue = FileQueue(args.jobs, args.output, shard, shards, args.retry_failed)
+
+    backend, cassette = create_backend(
+        args.backend, args.recordings, args.speed, args.cassette
+    )
+    try:
+        return await run_worker_pool(
+            queue,
+            backend,
+            definitions,
+            args.agent,
+            workers=args.workers,
+            rates=rates,
+            max_attempts=args.max_attempts,
+            timeout=args.timeout,
+            shard=shard,
+        )
+    finally:
+        await backend.close()
+        if cassette:
+            cassette.save()
+        queue.close()
+
+
+def shard_main(args: argparse.Namespace, shard: int, shards: int) -> Dict[str, int]:
+    return asyncio.run(run_shard(args, shard, shards))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queue-driven agent worker")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jobs", help="JSONL file with jobs")
+    source.add_argument("--queue", help="SQLite queue database")
+    parser.add_argument("--enqueue", help="add the jobs of this JSONL file to --queue")
+    parser.add_argument("--output", default="results.jsonl")
+    parser.add_argument("--definitions", default="eval/definitions.json")
+    parser.add_argument("--agent", help="definition used for jobs without an agent")
+    parser.add_argument("--backend", choices=["mock", "foundry"], default="mock")
+    parser.add_argument("--recordings", default="eval/recorded.jsonl")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--cassette", help="foundry backend: record/replay cassette")
+    parser.add_argument(
+        "--workers", type=int, default=8, help="asyncio workers/process"
+    )
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument(
+        "--rate", action="append", help="per-agent limit, e.g. Jonny_Weather=5 (runs/s)"
+    )
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument(
+        "--retry-failed", action="store_true", help="run failed jobs again"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=300, help="seconds per attempt"
+    )
+    args = parser.parse_args()
+    if args.cassette and args.processes > 1:
+        parser.error("--cassette needs a single process")
+
+    if args.queue:
+        queue = SqliteQueue(args.queue)
+        if args.enqueue:
+            print(f"Enqueued {queue.enqueue(args.enqueue)} jobs")
+        queue.requeue(args.retry_failed)
+        queue.close()
+        if args.enqueue:
+            exit(0)
+
+    start = time.perf_counter()
+    if args.processes == 1:
+        counts = [shard_main(args, 0, 1)]
+    else:
+        # file jobs are split by id hash, SQLite jobs are claimed from the shared queue
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            counts = pool.starmap(
+                shard_main,
+                [(args, shard, args.processes) for shard in range(args.processes)],
+            )
+    elapsed = time.perf_counter() - start
+    done = sum(c["done"] for c in counts)
+    failed = sum(c["failed"] for c in counts)
+    retried = sum(c["retried"] for c in counts)
+    print(
+        f"{done} done, {failed} failed, {retried} retries in {elapsed:.1f} s "
+        f"({(done + failed) / elapsed if elapsed else 0:.1f} jobs/s)"
+    )
+    if args.queue:
+        queue = SqliteQueue(args.queue)
+        left = queue.counts()
+        queue.close()
+        if left.get("pending") or left.get("running"):
+            print(
+                f"Not finished: {left.get('pending', 0)} pending, "
+                f"{left.get('running', 0)} running in other workers (or leased by a "
+                f"stopped one for up to {LEASE_SECONDS} s)"
+            )